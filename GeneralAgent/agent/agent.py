@@ -1,5 +1,6 @@
 # Agent
 import os
+import time
 import logging
 from typing import Union
 from GeneralAgent.memory import StackMemory
@@ -7,6 +8,11 @@ from GeneralAgent.interpreter import Interpreter
 from GeneralAgent.interpreter import KnowledgeInterpreter
 from GeneralAgent.interpreter import RoleInterpreter, PythonInterpreter
 
+# 流式输出合并: 每批最多token数、初始token数、每次输出后批大小的增长倍数、最早缓存token的最长等待时间(秒，新token到来时检查)
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_MIN_BATCH_SIZE = 1
+DEFAULT_BATCH_SIZE_GROWTH_FACTOR = 2
+DEFAULT_BATCH_MAX_WAIT = 0.02
 
 class Agent():
     """
@@ -297,43 +303,58 @@ class Agent():
         self.memory.add_message('user', input)
 
     
+    def _active_interpreters(self):
+        # 禁用python运行时，不使用python解释器
+        if self.disable_python_run:
+            return [interpreter for interpreter in self.interpreters if interpreter.__class__ != PythonInterpreter]
+        return self.interpreters
+
     def _get_llm_messages(self):
         from GeneralAgent import skills
         # 获取记忆 + prompt
         messages = self.memory.get_messages()
-        if self.disable_python_run:
-            prompt = '\n\n'.join([interpreter.prompt(messages) for interpreter in self.interpreters if interpreter.__class__ != PythonInterpreter])
-        else:
-            prompt = '\n\n'.join([interpreter.prompt(messages) for interpreter in self.interpreters])
+        prompt = '\n\n'.join([interpreter.prompt(messages) for interpreter in self._active_interpreters()])
+        # 当前时间每轮都变，放在messages最后，保持system prompt前缀不变，可以命中LLM的prompt缓存
+        time_prompt = self.role_interpreter.current_time_prompt()
         # 动态调整记忆长度
         prompt_count = skills.string_token_count(prompt)
+        if time_prompt is not None:
+            prompt_count += skills.string_token_count(time_prompt)
         left_count = int(self.token_limit * 0.9) - prompt_count
-        messages = skills.cut_messages(messages, left_count)
+        # 超出长度时丢弃中间的消息，保留第一条消息(任务上下文)和最近的消息
+        messages = skills.cut_messages(messages, left_count, keep_first=1)
         # 组合messages
         messages = [{'role': 'system', 'content': prompt}] + messages
+        if time_prompt is not None:
+            messages += [{'role': 'system', 'content': time_prompt}]
         return messages
 
     def _llm_and_parse_output(self, messages, output_callback, verbose):
-        outputer = _PythonCodeFilter(output_callback, verbose)
+        batcher = _OutputBatcher(output_callback)
+        outputer = _PythonCodeFilter(batcher.process_text, verbose)
         from GeneralAgent import skills
         try:
-            result = ''
+            scanner = _FenceScanner(self._active_interpreters())
             is_stop = True
             is_break = False
             response = skills.llm_inference(messages, model=self.model, stream=True, api_key=self.api_key, base_url=self.base_url, **self.llm_args)
             message_id = None
             for token in response:
                 if token is None: break
-                result += token
                 outputer.process_text(token)
                 interpreter:Interpreter = None
-                for interpreter in self.interpreters:
-                    if self.disable_python_run and interpreter.__class__ == PythonInterpreter:
-                        continue
+                # 只对当前token可能完成匹配的解释器做正则匹配
+                candidates = scanner.feed(token)
+                if len(candidates) == 0:
+                    continue
+                result = scanner.text()
+                for interpreter in candidates:
                     if interpreter.output_match(result):
                         logging.debug('interpreter: ' + interpreter.__class__.__name__)
                         message_id = self.memory.add_message('assistant', result)
                         self.memory.push_stack()
+                        # 执行前输出缓存的token，保证输出顺序
+                        batcher.flush()
                         output, is_stop = interpreter.output_parse(result)
                         if self.python_run_result is not None:
                             output = output.strip()
@@ -341,7 +362,7 @@ class Agent():
                                 output = output[:50000] + '...'
                         self.memory.pop_stack()
                         message_id = self.memory.append_message('assistant', '\n' + output + '\n', message_id=message_id)
-                        result = ''
+                        scanner.reset()
                         # if is_stop:
                         outputer.process_text(None)
                         outputer.process_text('```output\n' + output + '\n```\n')
@@ -351,14 +372,17 @@ class Agent():
                         break
                 if is_break:
                     break
+            result = scanner.text()
             if len(result) > 0:
                 message_id = self.memory.add_message('assistant', result)
             outputer.flush()
+            batcher.flush()
             return is_stop
         except Exception as e:
             logging.exception(e)
             outputer.process_text(str(e))
             outputer.flush()
+            batcher.flush()
             return True
         
     def clear(self):
@@ -373,6 +397,121 @@ class Agent():
         self.python_interpreter = PythonInterpreter(self, serialize_path=self._python_path)
 
 
+def _can_output_match(interpreter):
+    # 有output_match_pattern，或者重写了output_match的解释器才可能匹配输出
+    return interpreter.output_match_pattern is not None or type(interpreter).output_match is not Interpreter.output_match
+
+
+class _FenceScanner():
+    """
+    流式输出的增量扫描器: 逐个token输入，记录每个解释器的匹配前缀(比如```python\\n#run code\\n)是否出现过，
+    以及当前token是否补全了匹配结尾(比如\\n```)。只有两者都满足的解释器才需要对整个输出做正则匹配。
+    没有匹配规则的解释器(比如Role、Knowledge)不参与扫描，不会被返回。
+    前缀/结尾无法从output_match_pattern推断，或者重写了output_match的解释器每个token都需要匹配。
+    """
+    def __init__(self, interpreters):
+        """
+        构造函数
+
+        @interpreters: 解释器列表，没有匹配规则的解释器会被忽略
+        """
+        self.interpreters = [x for x in interpreters if _can_output_match(x)]
+        self.literals = [(x.output_match_prefix, x.output_match_suffix) for x in self.interpreters]
+        # 保留上一段输出的结尾，用于发现跨token的前缀和结尾
+        sizes = [len(x) for literal in self.literals for x in literal if x is not None]
+        self.tail_size = max(sizes, default=1) - 1
+        self.reset()
+
+    def reset(self):
+        """
+        清空已扫描的输出
+        """
+        self.tokens = []
+        self.tail = ''
+        self.result = ''
+        self.prefix_seen = [prefix is None for prefix, _ in self.literals]
+
+    def feed(self, token):
+        """
+        输入新的token，返回需要做正则匹配的解释器列表
+        """
+        self.tokens.append(token)
+        self.result = None
+        window = self.tail + token
+        self.tail = window[-self.tail_size:] if self.tail_size > 0 else ''
+        candidates = []
+        for index, interpreter in enumerate(self.interpreters):
+            prefix, suffix = self.literals[index]
+            if not self.prefix_seen[index]:
+                self.prefix_seen[index] = prefix in window
+                if not self.prefix_seen[index]:
+                    continue
+            # 新的匹配只能以当前token结尾
+            if suffix is not None and window.find(suffix, max(0, len(window) - len(token) - len(suffix) + 1)) == -1:
+                continue
+            candidates.append(interpreter)
+        return candidates
+
+    def text(self):
+        """
+        返回已扫描的全部输出
+        """
+        if self.result is None:
+            self.result = ''.join(self.tokens)
+        return self.result
+
+
+class _OutputBatcher():
+    """
+    流式输出合并器，把多个token合并成一次输出回调，减少回调(print/网络发送)的次数。
+    没有定时器: 只在新token到来时检查批大小和等待时间，流暂停时缓存的token要等到下一个token、flush()或者None才输出。
+    """
+    def __init__(self, output_callback, batch_size=DEFAULT_BATCH_SIZE, min_batch_size=DEFAULT_MIN_BATCH_SIZE, growth_factor=DEFAULT_BATCH_SIZE_GROWTH_FACTOR, max_wait=DEFAULT_BATCH_MAX_WAIT):
+        """
+        构造函数
+
+        @output_callback: 输出回调函数
+
+        @batch_size: 每批最多合并的token数
+
+        @min_batch_size: 初始批大小，第一个token尽快输出
+
+        @growth_factor: 每次输出后批大小的增长倍数，直到batch_size
+
+        @max_wait: 最早缓存的token等待超过max_wait(秒)后，在下一个token到来时输出
+        """
+        self.output_callback = output_callback
+        self.max_batch_size = batch_size
+        self.batch_size = min_batch_size
+        self.growth_factor = growth_factor
+        self.max_wait = max_wait
+        self.pending = []
+        # 最早缓存的token的时间
+        self.pending_since = None
+
+    def process_text(self, text):
+        """
+        处理输出内容，None表示输出结束，先输出缓存内容
+        """
+        if text is None:
+            self.flush()
+            self.output_callback(None)
+            return
+        now = time.monotonic()
+        if len(self.pending) == 0:
+            self.pending_since = now
+        self.pending.append(text)
+        if len(self.pending) >= self.batch_size or now - self.pending_since >= self.max_wait:
+            self.flush()
+            self.batch_size = min(self.max_batch_size, self.batch_size * self.growth_factor)
+
+    def flush(self):
+        if self.pending:
+            self.output_callback(''.join(self.pending))
+            self.pending = []
+        self.pending_since = None
+
+
 class _PythonCodeFilter():
     """
     Python代码过滤器，用于隐藏Python代码块
@@ -1,4 +1,3 @@
-import re
 from .interpreter import Interpreter
 
 applescript_prompt = """
@@ -17,8 +16,7 @@ class AppleScriptInterpreter(Interpreter):
         return applescript_prompt
     
     def output_parse(self, string) -> (str, bool):
-        pattern = re.compile(self.output_match_pattern, re.DOTALL)
-        match = pattern.search(string)
+        match = self.output_search(string)
         assert match is not None
         sys_out = self._run_applescript(match.group(2))
         return sys_out.strip(), True
@@ -1,6 +1,63 @@
 # Interpreter
 import abc
 import re
+import functools
+
+_REGEX_SPECIAL_CHARS = '.^$*+?{}[]\\|()'
+
+
+def _has_literal_ends(pattern):
+    # alternation, lookaround and inline flags make the literal start / end of a match unknown
+    return '|' not in pattern and re.search(r'\(\?[^:]', pattern) is None
+
+
+def _literal_prefix(pattern):
+    """
+    return the literal text that every match of pattern starts with, or None when it can not be known
+    """
+    if not _has_literal_ends(pattern):
+        return None
+    prefix = ''
+    for char in pattern:
+        if char in _REGEX_SPECIAL_CHARS:
+            # a quantifier applies to the last literal, like ab*
+            if char in '*+?{':
+                prefix = prefix[:-1]
+            break
+        prefix += char
+    return prefix if len(prefix) > 0 else None
+
+
+def _literal_suffix(pattern):
+    """
+    return the literal text that every match of pattern ends with, or None when it can not be known
+    """
+    if not _has_literal_ends(pattern):
+        return None
+    suffix = ''
+    for char in reversed(pattern):
+        if char in _REGEX_SPECIAL_CHARS:
+            # the literals after a backslash start with an escape sequence.
+            # \d, \n, \. use one char; \x41, \101, \u0041 use more, so the suffix is unknown
+            if char == '\\':
+                if len(suffix) > 0 and (suffix[0].isdigit() or suffix[0] in 'xuUN'):
+                    return None
+                suffix = suffix[1:]
+            break
+        suffix = char + suffix
+    return suffix if len(suffix) > 0 else None
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_output_match(pattern):
+    """
+    return (compiled regex, literal prefix, literal suffix) of output_match_pattern.
+    Patterns are class level constants, so they are compiled once per process instead of once per interpreter instance.
+    """
+    if pattern is None:
+        return None, None, None
+    return re.compile(pattern, re.DOTALL), _literal_prefix(pattern), _literal_suffix(pattern)
+
 
 class Interpreter(metaclass=abc.ABCMeta):
     """
@@ -8,6 +65,29 @@ class Interpreter(metaclass=abc.ABCMeta):
     output_match_pattern is the pattern to match the LLM ouput string. for example ```tsx\n(.*?)\n```
     """
     output_match_pattern = None
+    _last_match = (None, None)
+
+    @property
+    def output_match_regex(self):
+        """
+        compiled output_match_pattern (re.DOTALL), shared by all interpreters with the same pattern
+        """
+        return _compile_output_match(self.output_match_pattern)[0]
+
+    @property
+    def output_match_prefix(self):
+        """
+        literal text that every match of output_match_pattern starts with, for example ```python\\n#run code\\n . None when unknown.
+        """
+        return _compile_output_match(self.output_match_pattern)[1]
+
+    @property
+    def output_match_suffix(self):
+        """
+        literal text that every match of output_match_pattern ends with, for example \\n``` . None when unknown.
+        In a stream, a new match can only appear when the new text completes this suffix.
+        """
+        return _compile_output_match(self.output_match_pattern)[2]
 
     def prompt(self, messages) -> str:
         """
@@ -16,10 +96,31 @@ class Interpreter(metaclass=abc.ABCMeta):
         """
         return ''
 
-    def output_match(self, string) -> bool:
+    def output_search(self, string):
+        """
+        search output_match_pattern in string, return re.Match or None.
+        The literal prefix is located with str.find first, so the regex only runs from the first possible start.
+        A match is kept for the next call with the same string, so output_parse after output_match does not search again.
+        """
         if self.output_match_pattern is None:
-            return False
-        match = re.compile(self.output_match_pattern, re.DOTALL).search(string)
+            return None
+        last_string, last_match = self._last_match
+        self._last_match = (None, None)
+        if last_string is string and last_match.re is self.output_match_regex:
+            return last_match
+        start = 0
+        prefix = self.output_match_prefix
+        if prefix is not None:
+            start = string.find(prefix)
+            if start == -1:
+                return None
+        match = self.output_match_regex.search(string, start)
+        if match is not None:
+            self._last_match = (string, match)
+        return match
+
+    def output_match(self, string) -> bool:
+        match = self.output_search(string)
         if match is not None:
             return True
         else:
@@ -1,7 +1,7 @@
-import re, io, os, sys
+import io, os, sys
 import pickle
 import logging
-from jinja2 import Template
+from GeneralAgent.utils import get_template
 from .interpreter import Interpreter
 from functools import partial
 
@@ -43,6 +43,7 @@ print('Hello, world!')
 """
 
     function_tools = []
+    _functions_description = (None, '')
 
     def __init__(self, 
                  agent = None,
@@ -66,6 +67,7 @@ print('Hello, world!')
         self.import_code = import_code or default_import_code
         self.serialize_path = serialize_path
         self.prompt_append = prompt_append
+        self.python_version = skills.get_python_version()
         # self.tools = tools or Tools([])
         self.globals = self.load()
         # count the number of times the code is wrong, and stop running when it reaches the threshold
@@ -82,14 +84,24 @@ print('Hello, world!')
         return {}
 
     def prompt(self, messages) -> str:
-        from GeneralAgent import skills
-        funtions = '\n\n'.join([skills.get_function_signature(x) for x in self.function_tools])
         variables = {
             'python_libs': self.python_libs,
-            'python_funcs': funtions,
-            'python_version': skills.get_python_version()
+            'python_funcs': self.functions_description(),
+            'python_version': self.python_version
         }
-        return Template(self.python_prompt_template).render(**variables) + self.prompt_append
+        return get_template(self.python_prompt_template).render(**variables) + self.prompt_append
+
+    def functions_description(self) -> str:
+        """
+        signatures of function_tools, regenerated only when function_tools changes
+        """
+        from GeneralAgent import skills
+        functions, description = self._functions_description
+        if functions != tuple(self.function_tools):
+            functions = tuple(self.function_tools)
+            description = '\n\n'.join([skills.get_function_signature(x) for x in functions])
+            self._functions_description = (functions, description)
+        return description
 
     def save(self):
         if self.serialize_path is None:
@@ -113,8 +125,7 @@ print('Hello, world!')
         return save_globals
 
     def output_parse(self, string) -> (str, bool):
-        pattern = re.compile(self.output_match_pattern, re.DOTALL)
-        match = pattern.search(string)
+        match = self.output_search(string)
         assert match is not None
         result, stop = self.run_code(match.group(1))
         result = '\nThe execution of the python code is completed, and the result is as follows:\n' + result + '\n'
@@ -1,11 +1,13 @@
 import os
 import datetime
 import platform
-from jinja2 import Template
+import functools
+from GeneralAgent.utils import get_template
 from .interpreter import Interpreter
 
+@functools.lru_cache(maxsize=None)
 def get_os_version() -> str:
-    import platform
+    # 进程内不变，只计算一次
     system = platform.system()
     if system == 'Windows':
         version = platform.version()
@@ -14,13 +16,16 @@ def get_os_version() -> str:
         version = platform.mac_ver()[0]
         return f"macOS version: {version}"
     elif system == 'Linux':
-        version = platform.platform()
+        try:
+            # python >= 3.10
+            version = platform.freedesktop_os_release().get('PRETTY_NAME', platform.platform())
+        except (AttributeError, OSError):
+            version = platform.platform()
         return f"Linux version: {version}"
     else:
         return "Unknown system"
 
 default_system_role = """
-Current Time: {{now}}
 You are an agent on the {{os_version}} computer, tasked with assisting users in resolving their issues. 
 You have the capability to control the computer and access the internet. 
 All code in ```python ``` will be automatically executed by the system. So if you don't need to run the code, please don't write it in the code block.
@@ -117,11 +122,20 @@ class RoleInterpreter(Interpreter):
         if self.system_role is not None:
             prompt = self.system_role
         else:
-            prompt = Template(default_system_role).render(os_version=self.os_version, now=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            prompt = get_template(default_system_role).render(os_version=self.os_version)
         if self.self_control:
             prompt += '\n\n' + self_call_prompt
         if self.search_functions:
             prompt += '\n\n' + function_search_prompt
         if self.role is not None:
             prompt += '\n\n' + self.role
-        return prompt
\ No newline at end of file
+        return prompt
+
+    def current_time_prompt(self) -> str:
+        """
+        Current time for the default system role, None when system_role is customized.
+        It changes every turn, so it is not part of prompt(): the agent puts it after the messages, and the system prompt prefix stays the same (LLM prompt cache).
+        """
+        if self.system_role is not None:
+            return None
+        return 'Current Time: ' + datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -1,4 +1,3 @@
-import re
 from .interpreter import Interpreter
 
 shell_prompt = """
@@ -17,8 +16,7 @@ class ShellInterpreter(Interpreter):
         return shell_prompt
 
     def output_parse(self, string) -> (str, bool):
-        pattern = re.compile(self.output_match_pattern, re.DOTALL)
-        match = pattern.search(string)
+        match = self.output_search(string)
         assert match is not None
         output = self._run_bash(match.group(1))
         return output.strip(), True
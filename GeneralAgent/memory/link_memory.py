@@ -1,7 +1,6 @@
 from dataclasses import dataclass
 from typing import List
-from tinydb import TinyDB, Query
-from tinydb.storages import MemoryStorage
+from .storage import open_db, defer_save
 
 @dataclass
 class LinkMemoryNode:
@@ -27,9 +26,9 @@ def summarize_and_segment(text, output_callback=None):
     if output_callback is not None:
         output_callback(f'Summary: {summary}\n')
     segments = skills.segment_text(text)
-    if output_callback is not None:
-        for key in segments:
-            output_callback(f'<<{key}>>\n')
+    if output_callback is not None and len(segments) > 0:
+        # 所有key合并为一次输出
+        output_callback(''.join([f'<<{key}>>\n' for key in segments]))
     return summary, segments
 
 
@@ -41,11 +40,8 @@ class LinkMemory():
         """
         self.serialize_path = serialize_path
         self.short_memory_limit = short_memory_limit
-        if serialize_path is not None:
-            self.db = TinyDB(serialize_path)
-        else:
-            # 内存存储，不序列化
-            self.db = TinyDB(storage=MemoryStorage)
+        # serialize_path为None时使用内存存储，不序列化
+        self.db = open_db(serialize_path)
         nodes = [LinkMemoryNode(**x) for x in self.db.all()]
         self.concepts = dict(zip([node.key for node in nodes], nodes))
         self.short_memory = ''
@@ -76,27 +72,29 @@ class LinkMemory():
             task = '\n'.join([f'{x["role"]}: {x["content"]}' for x in messages])
             info = skills.extract_info(background, task)
             line_numbers, keys = skills.parse_extract_info(info)
+            items = [xx[line_number] for line_number in line_numbers if line_number < len(xx) and line_number >= 0]
+            items += [f'{key}\n{self.concepts[key]}\n' for key in keys if key in self.concepts]
             result = []
-            for line_number in line_numbers:
-                if line_number < len(xx) and line_number >= 0:
-                    result.append(xx[line_number])
-                    if skills.string_token_count('\n'.join(result)) > limit_token_count:
-                        return '\n'.join(result[:-1])
-            for key in keys:
-                if key in self.concepts:
-                    result.append(f'{key}\n{self.concepts[key]}\n')
-                    if skills.string_token_count('\n'.join(result)) > limit_token_count:
-                        return '\n'.join(result[:-1])
+            token_count = 0
+            for item in items:
+                # 保守估算: 累加每一条的token数，连接的换行按1个token计算(第一条没有换行)。
+                # 连接处的token可能合并(比如\n\n是1个token)，估算可能比实际多，会提前截断
+                token_count += skills.string_token_count(item) + (1 if len(result) > 0 else 0)
+                if token_count > limit_token_count:
+                    break
+                result.append(item)
             return '\n'.join(result)
 
     def _load_short_memory(self):
         short_memorys = self.db.table('short_memory').all()
         self.short_memory = '' if len(short_memorys) == 0 else short_memorys[0]['content']
 
+    @defer_save
     def _save_short_memory(self):
         self.db.table('short_memory').truncate()
         self.db.table('short_memory').insert({'content': self.short_memory})
 
+    @defer_save
     def _summarize_content(self, input, output_callback=None):
         from GeneralAgent import skills
         inputs = skills.split_text(input, max_token=3000)
@@ -106,18 +104,20 @@ class LinkMemory():
             for key in nodes:
                 new_key = self._add_node(key, nodes[key])
                 new_nodes[new_key] = nodes[key]
+            # 新节点的key不重复，一次性写入
+            self.db.insert_multiple([self.concepts[key].__dict__ for key in new_nodes])
             self.short_memory += '\n' + summary + ' Detail in ' + ', '.join([f'<<{key}>>' for key in new_nodes])
         self.short_memory = self.short_memory.strip()
         self._save_short_memory()
 
     def _add_node(self, key, value):
+        # 添加节点(key重复时加数字后缀)，返回新的key。由调用方写入数据库
         index = 0
         new_key = key
         while new_key in self.concepts:
             index += 1
             new_key = key + str(index)
         self.concepts[new_key] = LinkMemoryNode(key=new_key, content=value)
-        self.db.upsert(self.concepts[key].__dict__, Query().key == new_key)
         return new_key
     
     def __str__(self):
@@ -1,9 +1,9 @@
 # Memeory
+import os
 import json
 from dataclasses import dataclass
 from typing import List, Union
-from tinydb import TinyDB, Query
-from tinydb.storages import MemoryStorage
+from .storage import open_db, defer_save
 
 
 @dataclass
@@ -40,18 +40,20 @@ class StackMemory:
         """
         @serialize_path: str, 序列化路径，默认为'./memory.json'。如果为None，则使用内存存储
         """
-        if serialize_path is not None:
-            self.db = TinyDB(serialize_path)
-        else:
-            # 内存存储，不序列化
-            self.db = TinyDB(storage=MemoryStorage)
-        nodes = [StackMemoryNode(**node) for node in self.db.all()]
+        # serialize_path为None时使用内存存储，不序列化
+        self.db = open_db(serialize_path)
+        # 图片base64编码缓存: image_path -> (修改时间, url)
+        self._image_urls = {}
+        documents = self.db.all()
+        nodes = [StackMemoryNode(**document) for document in documents]
         self.spark_nodes = dict(zip([node.node_id for node in nodes], nodes))
+        # node_id -> 数据库doc_id，按doc_id更新和删除，不需要查询整个表
+        self._doc_ids = dict(zip([node.node_id for node in nodes], [document.doc_id for document in documents]))
         # add root node
         if len(self.spark_nodes) == 0:
             root_node = StackMemoryNode.new_root()
-            self.spark_nodes[root_node.node_id] = root_node
-            self.db.insert(root_node.__dict__)
+            self._insert_node(root_node)
+        self._last_node_id = max(self.spark_nodes.keys())
         # load current_node
         current_nodes = self.db.table('current_node').all()
         if len(current_nodes) > 0:
@@ -63,6 +65,7 @@ class StackMemory:
         if self.current_node.is_root():
             self.next_position = 'in'
 
+    @defer_save
     def set_current_node(self, current_node):
         self.current_node = current_node
         # save current node
@@ -71,12 +74,14 @@ class StackMemory:
         # 同步数据库
 
     def new_node_id(self):
-        return max(self.spark_nodes.keys()) + 1
+        self._last_node_id += 1
+        return self._last_node_id
     
     def node_count(self):
         # ignore root node
         return len(self.spark_nodes.keys()) - 1
 
+    @defer_save
     def add_node(self, node):
         # put in root node
         root_node = self.get_node(0)
@@ -85,9 +90,9 @@ class StackMemory:
         root_node.childrens.append(node.node_id)
         # save node
         self.update_node(root_node)
-        self.db.insert(node.__dict__)
-        self.spark_nodes[node.node_id] = node
+        self._insert_node(node)
 
+    @defer_save
     def delete_node(self, node):
         # delete node and all its childrens
         for children_id in node.childrens:
@@ -97,10 +102,11 @@ class StackMemory:
         if parent:
             parent.childrens.remove(node.node_id)
             self.update_node(parent)
-        self.db.remove(Query().node_id == node.node_id)
+        self.db.remove(doc_ids=[self._doc_ids.pop(node.node_id)])
         del self.spark_nodes[node.node_id]
 
     
+    @defer_save
     def add_node_after(self, last_node, node):
         # add node after last_node
         node.node_id = self.new_node_id()
@@ -118,10 +124,10 @@ class StackMemory:
             children.parent = node.node_id
             self.update_node(children)
         # save node
-        self.db.insert(node.__dict__)
-        self.spark_nodes[node.node_id] = node
+        self._insert_node(node)
         return node
     
+    @defer_save
     def add_node_in(self, parent_node, node, put_first=False):
         # add node in parent_node
         node.node_id = self.new_node_id()
@@ -132,8 +138,7 @@ class StackMemory:
             parent_node.childrens.append(node.node_id)
         self.update_node(parent_node)
         # save node
-        self.db.insert(node.__dict__)
-        self.spark_nodes[node.node_id] = node
+        self._insert_node(node)
         return node
     
     def get_node(self, node_id):
@@ -152,7 +157,11 @@ class StackMemory:
             return self.get_node(node.parent)
     
     def update_node(self, node):
-        self.db.update(node.__dict__, Query().node_id == node.node_id)
+        self.db.update(node.__dict__, doc_ids=[self._doc_ids[node.node_id]])
+
+    def _insert_node(self, node):
+        self._doc_ids[node.node_id] = self.db.insert(node.__dict__)
+        self.spark_nodes[node.node_id] = node
 
     def get_level(self, node):
         if node.is_root():
@@ -163,24 +172,31 @@ class StackMemory:
     def get_related_nodes_for_node(self, node):
         # ancestors + left_brothers + self
         parent = self.get_node_parent(node)
-        brothers = [self.get_node(node_id) for node_id in parent.childrens]
-        left_brothers = [('brother', x) for x in brothers[:brothers.index(node)]]
-        if self.get_level(parent) != 0:
-            left_brothers = left_brothers[-4:]
+        # 按node_id定位，非顶层只取最近的4个左兄弟节点
+        index = parent.childrens.index(node.node_id)
+        start = 0 if parent.is_root() else max(0, index - 4)
+        left_brothers = [('brother', self.get_node(node_id)) for node_id in parent.childrens[start:index]]
         ancestors = self.get_related_nodes_for_node(parent) if not parent.is_root() else []
         return ancestors + left_brothers + [('direct', node)]
     
+    def _encode_image(self, image_path):
+        # 图片转为base64 url。每轮对话都会用到，文件没有修改时使用缓存，不重复读取和编码
+        if image_path.startswith('http'):
+            return image_path
+        mtime = os.path.getmtime(image_path)
+        cached = self._image_urls.get(image_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        import base64
+        with open(image_path, "rb") as image_file:
+            bin_data = base64.b64encode(image_file.read()).decode('utf-8')
+        image_type = image_path.split('.')[-1].lower()
+        virtural_url = f"data:image/{image_type};base64,{bin_data}"
+        self._image_urls[image_path] = (mtime, virtural_url)
+        return virtural_url
+
     def get_related_messages_for_node(self, node: StackMemoryNode):
         # 获取节点相关的消息列表(OpenAI格式，包含图片)
-        def _encode_image(image_path):
-            if image_path.startswith('http'):
-                return image_path
-            import base64
-            with open(image_path, "rb") as image_file:
-                bin_data = base64.b64encode(image_file.read()).decode('utf-8')
-            image_type = image_path.split('.')[-1].lower()
-            virtural_url = f"data:image/{image_type};base64,{bin_data}"
-            return virtural_url
         nodes_with_position = self.get_related_nodes_for_node(node)
         def _parse_node(node):
             if node.type == 'list':
@@ -192,7 +208,7 @@ class StackMemory:
                     elif isinstance(item, dict):
                         key = list(item.keys())[0]
                         if key == 'image':
-                            url = _encode_image(item[key]) 
+                            url = self._encode_image(item[key])
                             contents.append({'type': 'image_url', "image_url": { "url": url}})
                         elif key == 'text':
                             contents.append({'type': 'text', 'text': item[key]})
@@ -226,6 +242,7 @@ class StackMemory:
         self.next_position = 'in'
         return self.current_node.node_id
 
+    @defer_save
     def add_message(self, role, message: Union[str, list]):
         assert role in ['user', 'system', 'assistant'], role
         type = 'text'
@@ -241,6 +258,7 @@ class StackMemory:
         self.set_current_node(new_node)
         return new_node.node_id
     
+    @defer_save
     def append_message(self, role, message, message_id=None):
         if message_id is None:
             message_id = self.current_node.node_id
@@ -252,6 +270,7 @@ class StackMemory:
         self.set_current_node(node)
         return node.node_id
 
+    @defer_save
     def pop_stack(self):
         if self.next_position == 'in':
             self.next_position = 'after'
@@ -260,6 +279,7 @@ class StackMemory:
             self.next_position = 'after'
             return self.current_node.node_id
     
+    @defer_save
     def pop_stack_to(self, node_id):
         self.set_current_node(self.get_node(node_id))
         self.next_position = 'after'
@@ -0,0 +1,101 @@
+# TinyDB storage for memory serialization
+import os
+import json
+import functools
+from contextlib import contextmanager
+from tinydb import TinyDB
+from tinydb.storages import Storage, MemoryStorage
+from tinydb.middlewares import CachingMiddleware
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonStorage(Storage):
+    """
+    TinyDB json file storage, (de)serialize with orjson when it is installed (pip install GeneralAgent[orjson]), otherwise with json.
+    Data orjson can not handle, like lone surrogates, falls back to json.
+    The file format is the same as tinydb JSONStorage, so existing memory files can be loaded.
+    """
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            open(path, 'a').close()
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        if len(content) == 0:
+            return None
+        if orjson is not None:
+            try:
+                return orjson.loads(content)
+            except ValueError:
+                # orjson rejects lone surrogates (written by json as \udc80), read them with json
+                pass
+        return json.loads(content)
+
+    def write(self, data):
+        content = None
+        if orjson is not None:
+            try:
+                content = orjson.dumps(data)
+            except TypeError:
+                # lone surrogates (like surrogateescape file names) are not valid UTF-8 for orjson, write them with json
+                content = None
+        if content is None:
+            content = json.dumps(data).encode('utf-8')
+        with open(self.path, 'wb') as f:
+            f.write(content)
+            # make sure the file is on disk, like tinydb JSONStorage
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class DeferredWriteMiddleware(CachingMiddleware):
+    """
+    Write every change to the storage immediately, except inside defer_write(): the changes are kept in cache and written once when it exits.
+    """
+    def __init__(self, storage_cls):
+        super().__init__(storage_cls)
+        self._defer_level = 0
+
+    def write(self, data):
+        self.cache = data
+        self._cache_modified_count += 1
+        if self._defer_level == 0:
+            self.flush()
+
+    @contextmanager
+    def defer_write(self):
+        self._defer_level += 1
+        try:
+            yield
+        finally:
+            self._defer_level -= 1
+            if self._defer_level == 0:
+                self.flush()
+
+
+def open_db(serialize_path=None) -> TinyDB:
+    """
+    open a TinyDB for memory
+    @serialize_path: str, json file path. None means memory storage, not serialized
+    """
+    if serialize_path is not None:
+        return TinyDB(serialize_path, storage=DeferredWriteMiddleware(OrjsonStorage))
+    else:
+        return TinyDB(storage=DeferredWriteMiddleware(MemoryStorage))
+
+
+def defer_save(method):
+    """
+    decorator for memory methods: all db changes in the method are saved with one file write. self.db must be opened by open_db
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.db.storage.defer_write():
+            return method(self, *args, **kwargs)
+    return wrapper
@@ -31,7 +31,7 @@ def segment_text(text):
     将文本进行语义分段，返回分段后的文本和key组成的字典nodes
     """
     from GeneralAgent import skills
-    from jinja2 import Template
+    from GeneralAgent.utils import get_template
     segment_prompt = """
 ---------
 {{text}}
@@ -62,7 +62,7 @@ Please note, each title should not exceed 10 words. Titles exceeding this limit
     for index in range(len(lines)):
         new_lines.append(f'#{index} {lines[index]}')
     new_text = '\n'.join(new_lines)
-    prompt = Template(segment_prompt).render({'text': new_text})
+    prompt = get_template(segment_prompt).render({'text': new_text})
     messages = [
         {'role': 'system','content': 'You are a helpful assistant'},
         {'role': 'user','content': prompt}
@@ -120,8 +120,8 @@ Note: <<titles>> and line numbers provide up to 5 items each, so please select t
 """
 
     from GeneralAgent import skills
-    from jinja2 import Template
-    prompt = Template(prompt_template).render({'background': background, 'task': task})
+    from GeneralAgent.utils import get_template
+    prompt = get_template(prompt_template).render({'background': background, 'task': task})
     messages = [
         {'role': 'system','content': 'You are a helpful assistant'},
         {'role': 'user','content': prompt}
@@ -17,7 +17,11 @@ def get_os_version() -> str:
         version = platform.mac_ver()[0]
         return f"macOS version: {version}"
     elif system == 'Linux':
-        version = platform.platform()
+        try:
+            # python >= 3.10
+            version = platform.freedesktop_os_release().get('PRETTY_NAME', platform.platform())
+        except (AttributeError, OSError):
+            version = platform.platform()
         return f"Linux version: {version}"
     else:
         return "Unknown system"
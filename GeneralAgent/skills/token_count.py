@@ -29,7 +29,28 @@ def string_token_count(str):
     return len(tokens)
 
 
-def cut_messages(messages, token_limit):
-    while messages_token_count(messages) > token_limit:
-        messages.pop(0)
+def cut_messages(messages, token_limit, keep_first=0):
+    """
+    Cut messages (in place) to fit in token_limit by dropping the oldest messages.
+    @keep_first: keep the first keep_first messages (the task context), and drop the messages after them first.
+    """
+    # 每条消息只计算一次token数
+    counts = [messages_token_count([message]) - 3 for message in messages]
+    total = sum(counts) + 3
+    keep_first = min(keep_first, max(len(messages) - 1, 0))
+    # 1. drop the oldest messages after the first keep_first ones, keep the last message
+    start = keep_first
+    while total > token_limit and start < len(messages) - 1:
+        total -= counts[start]
+        start += 1
+    # 2. drop the first keep_first messages
+    head = 0
+    while total > token_limit and head < keep_first:
+        total -= counts[head]
+        head += 1
+    # 3. drop the last message
+    while total > token_limit and start < len(messages):
+        total -= counts[start]
+        start += 1
+    messages[:] = messages[head:keep_first] + messages[start:]
     return messages
\ No newline at end of file
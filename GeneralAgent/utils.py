@@ -1,5 +1,6 @@
 import os
 import logging
+import functools
 
 
 def set_logging_level():
@@ -22,4 +23,13 @@ def set_logging_level():
         level=level,
         format='%(asctime)s %(pathname)s [line:%(lineno)d] %(levelname)s %(funcName)s %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
-    )
\ No newline at end of file
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_template(source: str):
+    """
+    return the jinja2 Template of source. The template is parsed once and cached, so rendering it every turn is cheap.
+    """
+    from jinja2 import Template
+    return Template(source)
@@ -83,5 +83,53 @@ def test_knowledge():
         import shutil
         shutil.rmtree(workspace)
 
+def test_fence_scanner():
+    # 流式扫描: 只在代码块结束的token上触发python解释器的匹配，没有匹配规则的解释器不会被触发
+    from GeneralAgent.agent.agent import _FenceScanner
+    agent = Agent()
+    python_interpreter = agent.python_interpreter
+    scanner = _FenceScanner(agent.interpreters)
+    tokens = ['```bash\nls\n``', '`\n```py', 'thon\n#run code\n', 'x = "```"\n', '1 + 1\n`', '``\nafter']
+    triggers = []
+    for index, token in enumerate(tokens):
+        candidates = scanner.feed(token)
+        assert agent.role_interpreter not in candidates
+        assert agent.knowledge_interpreter not in candidates
+        if python_interpreter in candidates:
+            triggers.append(index)
+    assert triggers == [5]
+    assert scanner.text() == ''.join(tokens)
+    assert python_interpreter.output_match(scanner.text())
+
+def test_output_batcher():
+    # 合并输出: 内容和顺序不变，None之前先输出缓存的token
+    from GeneralAgent.agent.agent import _OutputBatcher
+    outputs = []
+    batcher = _OutputBatcher(outputs.append, max_wait=60)
+    tokens = [str(x) for x in range(40)]
+    for token in tokens:
+        batcher.process_text(token)
+    batcher.process_text(None)
+    assert outputs[-1] is None
+    assert ''.join(outputs[:-1]) == ''.join(tokens)
+    assert len(outputs) < len(tokens) + 1
+
+def test_output_flush_before_run(monkeypatch):
+    # python代码执行前，代码块之前的输出已经全部回调
+    outputs = []
+    code_seen = []
+    def mark():
+        """record the output before the code runs"""
+        code_seen.append(''.join([x for x in outputs if x is not None]))
+    agent = Agent(functions=[mark])
+    text = 'Sure.\n```python\n#run code\nmark()\n```\nnot shown'
+    def fake_llm_inference(messages, stream=False, **args):
+        return (text[i:i+3] for i in range(0, len(text), 3))
+    monkeypatch.setattr(skills, 'llm_inference', fake_llm_inference)
+    agent._llm_and_parse_output([], outputs.append, verbose=True)
+    assert len(code_seen) == 1
+    assert code_seen[0].startswith('Sure.\n```python\n#run code\nmark()\n```')
+    assert ''.join([x for x in outputs if x is not None]).startswith(code_seen[0] + '```output\n')
+
 if __name__ == '__main__':
     test_math()
\ No newline at end of file
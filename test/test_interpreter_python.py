@@ -56,6 +56,24 @@ test()
     # print(result)
     assert 'hello world' in result.strip()
 
+
+def test_output_match_literals():
+    interpreter = PythonInterpreter()
+    assert interpreter.output_match_prefix == '```python\n#run code\n'
+    assert interpreter.output_match_suffix == '\n```'
+    assert interpreter.output_match('```python\n#show code\na = 1\n```') is False
+    assert interpreter.output_match('text\n```python\n#run code\na = 1\n```') is True
+    # unknown suffix (alternation) falls back to None, the agent then always runs the regex
+    interpreter.output_match_pattern = '```python\n(.*?)\n```|```py\n(.*?)\n```'
+    assert interpreter.output_match_suffix is None
+    # escapes longer than one char after a backslash make the suffix unknown
+    from GeneralAgent.interpreter.interpreter import _literal_suffix
+    assert _literal_suffix(r'abc\101') is None
+    assert _literal_suffix(r'ab+c\x41') is None
+    assert _literal_suffix(r'abc\u0041') is None
+    assert _literal_suffix(r'(.*?)\n```') == '```'
+
+
 if __name__ == '__main__':
     # test_python_interpreter()
     # test_stack_code()
@@ -0,0 +1,13 @@
+from GeneralAgent import skills
+
+
+def test_cut_messages():
+    messages = [{'role': 'user', 'content': f'message {index} ' * 20} for index in range(10)]
+    limit = skills.messages_token_count(messages[:1] + messages[-3:])
+    # 默认丢弃最早的消息
+    result = skills.cut_messages(list(messages), limit)
+    assert result == messages[-4:]
+    # keep_first: 保留第一条消息，丢弃中间的消息
+    result = skills.cut_messages(list(messages), limit, keep_first=1)
+    assert result == messages[:1] + messages[-3:]
+    assert skills.messages_token_count(result) <= limit
@@ -59,5 +59,39 @@ def test_memory():
     if os.path.exists(serialize_path):
         os.remove(serialize_path)
 
+def test_delete_and_related_nodes():
+    serialize_path='./data/memory.json'
+    if os.path.exists(serialize_path):
+        os.remove(serialize_path)
+    memory = StackMemory(serialize_path=serialize_path)
+    parent = StackMemoryNode(role='user', content='parent')
+    memory.add_node(parent)
+    for index in range(6):
+        memory.add_node_in(parent, StackMemoryNode(role='system', content=str(index)))
+    memory.delete_node(memory.get_node(3))
+    memory.add_node_in(parent, StackMemoryNode(role='system', content='last'))
+    # 删除后重新加载，节点和新节点的id保持一致
+    memory = StackMemory(serialize_path=serialize_path)
+    assert memory.get_node(1).childrens == [2, 4, 5, 6, 7, 8]
+    # 非顶层节点只保留最近的4个左兄弟节点
+    messages = memory.get_related_messages_for_node(memory.get_node(8))
+    assert [x['content'] for x in messages] == ['parent', '2', '3', '4', '5', 'last']
+    if os.path.exists(serialize_path):
+        os.remove(serialize_path)
+def test_surrogate_content():
+    # orjson不能序列化单独的surrogate，存储时回退到json，之后的写入和加载不受影响
+    serialize_path='./data/memory.json'
+    if os.path.exists(serialize_path):
+        os.remove(serialize_path)
+    memory = StackMemory(serialize_path=serialize_path)
+    memory.add_message('assistant', 'file: \udc80.txt')
+    memory.add_message('user', 'next')
+    memory = StackMemory(serialize_path=serialize_path)
+    assert [x['content'] for x in memory.get_messages()] == ['file: \udc80.txt', 'next']
+    if os.path.exists(serialize_path):
+        os.remove(serialize_path)
+
 if __name__ == '__main__':
-    test_memory()
\ No newline at end of file
+    test_memory()
+    test_delete_and_related_nodes()
+    test_surrogate_content()
\ No newline at end of file